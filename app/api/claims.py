@@ -1,14 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.openapi.constants import REF_PREFIX
 from fastapi.responses import JSONResponse
 from sqlmodel import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from typing import List as PyList
-from pydantic import BaseModel
-import json
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+from pydantic import BaseModel, TypeAdapter, ValidationError
+import io
 
 from app.database import get_session
+from app.limiter import limiter
 from app.models import ClaimRead, TopProviderResponse
 from app.services.claim_processor import ClaimProcessor
 
@@ -16,21 +18,44 @@ class ClaimItem(BaseModel):
     """Model for claim item in JSON payload"""
     service_date: str
     submitted_procedure: str
-    quadrant: str = None
-    plan_group: str = None
-    subscriber: str = None
-    provider_npi: str = None
-    provider_fees: str = None
-    allowed_fees: str = None
-    member_coinsurance: str = None
-    member_copay: str = None
+    quadrant: Optional[str] = None
+    plan_group: Optional[str] = None
+    subscriber: Optional[str] = None
+    provider_npi: Optional[str] = None
+    provider_fees: Optional[str] = None
+    allowed_fees: Optional[str] = None
+    member_coinsurance: Optional[str] = None
+    member_copay: Optional[str] = None
 
 class ClaimsPayload(BaseModel):
     """Model for claims payload"""
     claims: PyList[ClaimItem]
 
-# Create rate limiter
-limiter = Limiter(key_func=get_remote_address)
+# FastAPI only documents its 422 response for routes that declare parameters,
+# so /process, which reads the raw body itself, references the same schema
+VALIDATION_ERROR_RESPONSE = {
+    "description": "Validation Error",
+    "content": {
+        "application/json": {"schema": {"$ref": f"{REF_PREFIX}HTTPValidationError"}}
+    },
+}
+
+# Request body schema for the docs, since /process reads the raw body itself
+CLAIMS_PAYLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "application/json": {
+            "schema": {
+                "title": "ClaimsPayload",
+                "type": "object",
+                "required": ["claims"],
+                "properties": {
+                    "claims": {"type": "array", "items": ClaimItem.model_json_schema()},
+                },
+            }
+        }
+    },
+}
 
 # Create router
 router = APIRouter(prefix="/claims", tags=["claims"])
@@ -38,37 +63,48 @@ router = APIRouter(prefix="/claims", tags=["claims"])
 # Create claim processor instance
 claim_processor = ClaimProcessor()
 
+# Serializers for response bodies built from trusted database rows
+claims_adapter = TypeAdapter(List[ClaimRead])
+top_providers_adapter = TypeAdapter(List[TopProviderResponse])
 
-@router.post("/process", response_model=List[ClaimRead])
-async def process_claims(
-    claims_payload: ClaimsPayload, session: Session = Depends(get_session)
-):
+
+def claims_response(claims: List[ClaimRead]) -> Response:
+    """Serialize stored claims without re-validating them"""
+    return Response(content=claims_adapter.dump_json(claims), media_type="application/json")
+
+
+def top_providers_response(top_providers: List[Dict[str, Any]]) -> Response:
+    """Serialize aggregated provider totals without re-validating them"""
+    rows = [TopProviderResponse.model_construct(**provider) for provider in top_providers]
+    return Response(content=top_providers_adapter.dump_json(rows), media_type="application/json")
+
+
+@router.post(
+    "/process",
+    response_model=List[ClaimRead],
+    responses={422: VALIDATION_ERROR_RESPONSE},
+    openapi_extra={"requestBody": CLAIMS_PAYLOAD_REQUEST_BODY},
+)
+async def process_claims(request: Request, session: Session = Depends(get_session)):
     """Process claims from JSON payload"""
+    # Parse and validate the body in a single pass in pydantic-core
     try:
-        # Map standard JSON field names to CSV column names
-        mapped_claims = []
-        for claim in claims_payload.claims:
-            claim_dict = claim.dict()
-            mapped_claim = {
-                "service date": claim_dict["service_date"],
-                "submitted procedure": claim_dict["submitted_procedure"],
-                "quadrant": claim_dict["quadrant"],
-                "Plan/Group #": claim_dict["plan_group"],
-                "Subscriber#": claim_dict["subscriber"],
-                "Provider NPI": claim_dict["provider_npi"],
-                "provider fees": claim_dict["provider_fees"],
-                "Allowed fees": claim_dict["allowed_fees"],
-                "member coinsurance": claim_dict["member_coinsurance"],
-                "member copay": claim_dict["member_copay"]
-            }
-            mapped_claims.append(mapped_claim)
-        
-        # Convert mapped claims to JSON string
-        claims_json_str = json.dumps(mapped_claims)
-        
-        # Process claims
-        processed_claims = claim_processor.process_claims_json(claims_json_str, session)
-        return processed_claims
+        claims_payload = ClaimsPayload.model_validate_json(await request.body())
+    except ValidationError as e:
+        # Match the "body"-prefixed locations FastAPI reports for request bodies
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors()]
+        )
+
+    try:
+        # JSON field names already match the Claim fields; unset values fall back to defaults
+        rows = [claim.model_dump(exclude_none=True) for claim in claims_payload.claims]
+
+        # Process claims off the event loop; the database calls block
+        processed_claims = await run_in_threadpool(
+            claim_processor.process_claims_list, rows, session
+        )
+        return claims_response(processed_claims)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -79,15 +115,14 @@ async def process_claims_csv(
 ):
     """Process claims from CSV file"""
     try:
-        # Save uploaded file temporarily
-        file_path = f"/tmp/{file.filename}"
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-
-        # Process claims
-        processed_claims = claim_processor.process_claims_csv(file_path, session)
-        return processed_claims
+        # Read the spooled upload directly rather than copying it to a temporary file
+        csv_file = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+
+        # Process claims off the event loop; parsing and database calls block
+        processed_claims = await run_in_threadpool(
+            claim_processor.process_claims_csv_file, csv_file, session
+        )
+        return claims_response(processed_claims)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -95,12 +130,15 @@ async def process_claims_csv(
 @router.get("/top-providers", response_model=List[TopProviderResponse])
 @limiter.limit("10/minute")
 async def get_top_providers(
-    request: Request, limit: int = 10, session: Session = Depends(get_session)
+    request: Request,
+    limit: int = Query(default=10, ge=1, le=100),
+    session: Session = Depends(get_session),
 ):
     """
     Get top providers by net fee
     
-    This endpoint is rate limited to 10 requests per minute.
+    This endpoint is rate limited to 10 requests per minute, and limit must
+    be between 1 and 100.
     
     The algorithm used:
     1. Group claims by provider_npi
@@ -110,9 +148,14 @@ async def get_top_providers(
     
     Time complexity: O(n log n) where n is the number of providers
     Space complexity: O(n) for storing the aggregated results
+
+    Results are cached per limit for 60 seconds and invalidated whenever
+    new claims are stored, so repeated calls skip the aggregation.
     """
     try:
-        top_providers = claim_processor.get_top_providers_by_net_fee(session, limit)
-        return top_providers
+        top_providers = await run_in_threadpool(
+            claim_processor.get_top_providers_by_net_fee, session, limit
+        )
+        return top_providers_response(top_providers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
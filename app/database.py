@@ -1,4 +1,6 @@
 import os
+from typing import Any, Dict
+from sqlalchemy import event
 from sqlmodel import SQLModel, create_engine, Session
 from dotenv import load_dotenv
 
@@ -8,8 +10,43 @@ load_dotenv()
 # Get database URL from environment variable or use default SQLite URL
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./claims.db")
 
+# SQL statement logging is expensive under bulk inserts, so it is opt-in
+SQL_ECHO = os.getenv("SQL_ECHO") == "1"
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+engine_options: Dict[str, Any]
+if IS_SQLITE:
+    # SQLite connections are shared with FastAPI's worker threads
+    engine_options = {"connect_args": {"check_same_thread": False}}
+else:
+    # Sized per worker process; keep workers * (size + overflow) under the
+    # server's max_connections
+    engine_options = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    }
+
 # Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_engine(
+    DATABASE_URL,
+    echo=SQL_ECHO,
+    pool_pre_ping=True,
+    **engine_options,
+)
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Tune SQLite for batch inserts and aggregation queries"""
+        cursor = dbapi_connection.cursor()
+        # Write-ahead logging avoids a full sync per commit
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        # ~200 MB page cache and in-memory temp tables for GROUP BY/ORDER BY
+        cursor.execute("PRAGMA cache_size=-200000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
 
 # Function to create database tables
 def create_db_and_tables():
@@ -19,3 +56,11 @@ def create_db_and_tables():
 def get_session():
     with Session(engine) as session:
         yield session
+
+
+if __name__ == "__main__":
+    # Create the schema once before starting several uvicorn workers,
+    # so their startup hooks don't race to create the same tables
+    import app.models  # noqa: F401 - registers the tables on SQLModel.metadata
+
+    create_db_and_tables()
@@ -0,0 +1,19 @@
+import os
+from dotenv import load_dotenv
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+# Load environment variables
+load_dotenv()
+
+# Rate limit counters live in memory by default; point this at Redis
+# (e.g. redis://localhost:6379) to share limits across workers
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+
+# Create rate limiter shared by the app and its routers. The moving window
+# strategy is a sliding window that Redis checks atomically in one round-trip.
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    strategy="moving-window",
+)
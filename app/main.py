@@ -1,14 +1,11 @@
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
 from app.api.claims import router as claims_router
 from app.database import create_db_and_tables
-
-# Create rate limiter
-limiter = Limiter(key_func=get_remote_address)
+from app.limiter import limiter
 
 # Create FastAPI app
 app = FastAPI(
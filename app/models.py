@@ -1,8 +1,12 @@
-from typing import Optional
+from typing import Annotated, Optional
 from sqlmodel import Field, SQLModel
 from datetime import date
 from decimal import Decimal
-from pydantic import validator
+from sqlalchemy import Index
+from pydantic import PlainSerializer, field_validator
+
+# Money amounts are returned to API clients as JSON numbers
+Money = Annotated[Decimal, PlainSerializer(float, return_type=float, when_used="json")]
 
 
 class ClaimBase(SQLModel):
@@ -18,14 +22,16 @@ class ClaimBase(SQLModel):
     member_coinsurance: Decimal = Field(default=Decimal("0.00"))
     member_copay: Decimal = Field(default=Decimal("0.00"))
 
-    @validator("submitted_procedure")
+    @field_validator("submitted_procedure")
+    @classmethod
     def validate_submitted_procedure(cls, v):
         """Validate that submitted procedure begins with the letter 'D'"""
         if not v or not v.startswith("D"):
             raise ValueError("Submitted procedure must begin with the letter 'D'")
         return v
 
-    @validator("provider_npi")
+    @field_validator("provider_npi")
+    @classmethod
     def validate_provider_npi(cls, v):
         """Validate that provider NPI is a 10 digit number"""
         if not v or not v.isdigit() or len(v) != 10:
@@ -35,6 +41,11 @@ class ClaimBase(SQLModel):
 
 class Claim(ClaimBase, table=True):
     """Claim model for database storage"""
+    # Covers the top-providers aggregation (GROUP BY provider_npi, SUM(net_fee))
+    __table_args__ = (
+        Index("ix_claim_provider_npi_net_fee", "provider_npi", "net_fee"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     claim_id: str = Field(default="", index=True)
     net_fee: Decimal = Field(default=Decimal("0.00"))
@@ -49,20 +60,20 @@ class ClaimRead(SQLModel):
     """Model for reading a claim"""
     id: int
     claim_id: str
-    net_fee: Decimal
+    net_fee: Money
     service_date: date
     submitted_procedure: str
     quadrant: Optional[str] = None
     plan_group: str
     subscriber: str
     provider_npi: str
-    provider_fees: Decimal
-    allowed_fees: Decimal
-    member_coinsurance: Decimal
-    member_copay: Decimal
+    provider_fees: Money
+    allowed_fees: Money
+    member_coinsurance: Money
+    member_copay: Money
 
 
 class TopProviderResponse(SQLModel):
     """Model for top provider response"""
     provider_npi: str
-    total_net_fee: Decimal
+    total_net_fee: Money
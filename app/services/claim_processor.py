@@ -1,20 +1,78 @@
-import uuid
+import os
 import csv
 import json
+import threading
+import time
 from decimal import Decimal
-from datetime import datetime
-from typing import Dict, List, Any
-from sqlmodel import Session, select
-from app.models import Claim, ClaimCreate
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, Final, Iterable, Iterator, List, Any, TextIO, Tuple, Union
+from sqlalchemy import bindparam, func, insert
+from sqlmodel import Session, col, select
+from app.models import Claim, ClaimCreate, ClaimRead
+
+# Maps lower-cased CSV column names to Claim field names
+FIELD_MAP: Final[Dict[str, str]] = {
+    "service date": "service_date",
+    "submitted procedure": "submitted_procedure",
+    "quadrant": "quadrant",
+    "plan/group #": "plan_group",
+    "subscriber#": "subscriber",
+    "provider npi": "provider_npi",
+    "provider fees": "provider_fees",
+    "allowed fees": "allowed_fees",
+    "member coinsurance": "member_coinsurance",
+    "member copay": "member_copay",
+}
+
+# Number of claims flushed to the database at a time during batch processing
+BATCH_SIZE: Final = 1000
+
+# Seconds a computed top-providers leaderboard is served from memory
+TOP_PROVIDERS_CACHE_TTL: Final = 60
+
+# Number of distinct limits whose leaderboards are kept; the oldest is evicted first
+TOP_PROVIDERS_CACHE_SIZE: Final = 16
+
+# Sum of net fees grouped by provider_npi. Built once at import so each call
+# only binds the limit instead of reconstructing the statement.
+_total_net_fee = func.sum(Claim.net_fee).label("total_net_fee")
+TOP_PROVIDERS_QUERY: Final = (
+    select(Claim.provider_npi, _total_net_fee)
+    .group_by(Claim.provider_npi)
+    .order_by(_total_net_fee.desc())
+    .limit(bindparam("limit"))
+)
+
+# Bulk insert of claim rows, returning each generated primary key with its claim_id.
+# RETURNING rows are matched by claim_id rather than sort_by_parameter_order, which
+# SQLite can only honour by sending one INSERT per row.
+INSERT_CLAIMS: Final = insert(Claim).returning(col(Claim.id), col(Claim.claim_id))
 
 
 class ClaimProcessor:
     """Service for processing claims"""
 
+    def __init__(self) -> None:
+        # Top-providers results keyed by limit, as (computed_at, providers)
+        self._top_providers_cache: Dict[int, Tuple[float, List[Dict[str, Any]]]] = {}
+        # Bumped on every save so a query that overlapped a save never caches
+        # its pre-commit result; the lock makes bump-and-clear and
+        # check-and-store atomic across threadpool threads
+        self._claims_generation = 0
+        self._cache_lock = threading.Lock()
+
     @staticmethod
-    def generate_claim_id() -> str:
-        """Generate a unique claim ID"""
-        return f"CLM-{uuid.uuid4().hex[:8].upper()}"
+    def generate_claim_ids(count: int) -> List[str]:
+        """Generate claim IDs in bulk from one read of random bytes, distinct within the batch"""
+        # Ordered dict keys drop the rare duplicate; top up until there are enough
+        claim_ids: Dict[str, None] = {}
+        while len(claim_ids) < count:
+            missing = count - len(claim_ids)
+            raw = os.urandom(missing * 4)
+            for i in range(0, missing * 4, 4):
+                claim_ids[f"CLM-{raw[i:i + 4].hex().upper()}"] = None
+        return list(claim_ids)
 
     @staticmethod
     def calculate_net_fee(
@@ -26,11 +84,14 @@ class ClaimProcessor:
         """
         Calculate the net fee based on the formula:
         net_fee = provider_fees + member_coinsurance + member_copay - allowed_fees
+
+        Amounts stay Decimal: the C decimal module makes this as cheap as
+        integer-cents math once the cents are converted back for storage.
         """
         return provider_fees + member_coinsurance + member_copay - allowed_fees
 
     @staticmethod
-    def parse_decimal(value: str) -> Decimal:
+    def parse_decimal(value: Union[str, Decimal]) -> Decimal:
         """Parse a string to a Decimal, handling currency format"""
         if isinstance(value, str):
             # Remove currency symbol and whitespace
@@ -38,144 +99,163 @@ class ClaimProcessor:
         return Decimal(value)
 
     @staticmethod
-    def parse_date(date_str: str) -> datetime.date:
-        """Parse a date string to a datetime.date object"""
+    @lru_cache(maxsize=4096)
+    def parse_date(date_str: str) -> date:
+        """Parse a date string to a date object, memoized since service dates repeat"""
         return datetime.strptime(date_str.split(" ")[0], "%m/%d/%y").date()
 
-    def process_claim_data(self, claim_data: Dict[str, Any], session: Session) -> Claim:
-        """Process a single claim and store it in the database"""
-        # Normalize keys to handle inconsistent capitalization
-        normalized_data = {}
+    @staticmethod
+    def normalize_claim_data(claim_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Map CSV column names to Claim field names, ignoring capitalization"""
+        normalized_data: Dict[str, Any] = {}
         for key, value in claim_data.items():
-            normalized_key = key.lower().strip()
-            normalized_data[normalized_key] = value
+            field_name = FIELD_MAP.get(key.lower().strip())
+            if field_name is not None:
+                normalized_data[field_name] = value
+        return normalized_data
 
+    def _build_claim_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate a row keyed by Claim field names and return its column values"""
         # Parse decimal values
-        provider_fees = self.parse_decimal(normalized_data.get("provider fees", "0.00"))
-        allowed_fees = self.parse_decimal(normalized_data.get("allowed fees", "0.00"))
-        member_coinsurance = self.parse_decimal(normalized_data.get("member coinsurance", "0.00"))
-        member_copay = self.parse_decimal(normalized_data.get("member copay", "0.00"))
+        provider_fees = self.parse_decimal(row.get("provider_fees", "0.00"))
+        allowed_fees = self.parse_decimal(row.get("allowed_fees", "0.00"))
+        member_coinsurance = self.parse_decimal(row.get("member_coinsurance", "0.00"))
+        member_copay = self.parse_decimal(row.get("member_copay", "0.00"))
 
         # Parse date
-        service_date = self.parse_date(normalized_data.get("service date", "1/1/00 0:00"))
+        service_date = self.parse_date(row.get("service_date", "1/1/00 0:00"))
 
         # Calculate net fee
         net_fee = self.calculate_net_fee(
             provider_fees, member_coinsurance, member_copay, allowed_fees
         )
 
-        # Create claim object
+        # Validate the claim
         claim_create = ClaimCreate(
             service_date=service_date,
-            submitted_procedure=normalized_data.get("submitted procedure", "D0000"),
-            quadrant=normalized_data.get("quadrant", None),
-            plan_group=normalized_data.get("plan/group #", "GRP-1000"),
-            subscriber=normalized_data.get("subscriber#", "0000000000"),
-            provider_npi=normalized_data.get("provider npi", "1234567890"),
+            submitted_procedure=row.get("submitted_procedure", "D0000"),
+            quadrant=row.get("quadrant", None),
+            plan_group=row.get("plan_group", "GRP-1000"),
+            subscriber=row.get("subscriber", "0000000000"),
+            provider_npi=row.get("provider_npi", "1234567890"),
             provider_fees=provider_fees,
             allowed_fees=allowed_fees,
             member_coinsurance=member_coinsurance,
             member_copay=member_copay,
         )
 
-        # Create database record
-        claim = Claim.from_orm(claim_create)
-        claim.claim_id = self.generate_claim_id()
-        claim.net_fee = net_fee
+        # Plain column values rather than a Claim instance: building ORM objects
+        # costs several times more than validation. claim_id is assigned on save.
+        claim_row = claim_create.model_dump()
+        claim_row["net_fee"] = net_fee
+
+        return claim_row
+
+    def _save_claims(self, claim_rows: Iterable[Dict[str, Any]], session: Session) -> List[ClaimRead]:
+        """Store claim rows in a single transaction, inserting as each batch fills"""
+        saved: List[ClaimRead] = []
+        batch: List[Dict[str, Any]] = []
+
+        # Insert in chunks so memory stays bounded,
+        # but commit only once for the whole batch
+        for claim_row in claim_rows:
+            batch.append(claim_row)
+            if len(batch) == BATCH_SIZE:
+                saved.extend(self._insert_batch(batch, session))
+                batch = []
+
+        if batch:
+            saved.extend(self._insert_batch(batch, session))
 
-        # Save to database
-        session.add(claim)
         session.commit()
-        session.refresh(claim)
+        self._invalidate_top_providers()
 
-        return claim
+        return saved
 
-    def process_claims_json(self, claims_json: str, session: Session) -> List[Claim]:
-        """Process multiple claims from a JSON string"""
-        claims_data = json.loads(claims_json)
-        processed_claims = []
+    def _insert_batch(self, batch: List[Dict[str, Any]], session: Session) -> List[ClaimRead]:
+        """Assign claim IDs to a batch of rows and insert them in one statement"""
+        for claim_row, claim_id in zip(batch, self.generate_claim_ids(len(batch))):
+            claim_row["claim_id"] = claim_id
 
-        for claim_data in claims_data:
-            processed_claim = self.process_claim_data(claim_data, session)
-            processed_claims.append(processed_claim)
+        result = session.execute(INSERT_CLAIMS, batch)
+        primary_keys = {claim_id: primary_key for primary_key, claim_id in result}
+        for claim_row in batch:
+            claim_row["id"] = primary_keys[claim_row["claim_id"]]
 
-        return processed_claims
+        # Rows are already validated, so skip validating them again
+        return [ClaimRead.model_construct(**claim_row) for claim_row in batch]
 
-    def process_claims_csv(self, csv_file_path: str, session: Session) -> List[Claim]:
-        """Process claims from a CSV file"""
-        processed_claims = []
+    def process_claim_data(self, claim_data: Dict[str, Any], session: Session) -> ClaimRead:
+        """Process a single claim and store it in the database"""
+        claim_row = self._build_claim_row(self.normalize_claim_data(claim_data))
 
-        # Read the file content
-        with open(csv_file_path, mode='r', encoding='utf-8') as file:
-            lines = file.readlines()
+        # Insert with RETURNING id rather than committing and refreshing the row
+        return self._save_claims([claim_row], session)[0]
 
-        if not lines:
-            return processed_claims
+    def process_claims_json(self, claims_json: str, session: Session) -> List[ClaimRead]:
+        """Process multiple claims from a JSON string"""
+        claims_data = json.loads(claims_json)
+        rows = [self.normalize_claim_data(claim_data) for claim_data in claims_data]
+
+        return self.process_claims_list(rows, session)
 
-        # Parse header
-        header_line = lines[0].strip()
-        # Replace quotes and split by comma
-        header_parts = [part.strip('"') for part in header_line.split(',')]
+    def process_claims_list(self, rows: List[Dict[str, Any]], session: Session) -> List[ClaimRead]:
+        """Process multiple claims keyed by Claim field names"""
+        claim_rows = [self._build_claim_row(row) for row in rows]
 
-        # Process each data line
-        for line_idx in range(1, len(lines)):
-            line = lines[line_idx].strip()
-            if not line:
+        return self._save_claims(claim_rows, session)
+
+    def process_claims_csv(self, csv_file_path: str, session: Session) -> List[ClaimRead]:
+        """Process claims from a CSV file"""
+        with open(csv_file_path, mode="r", encoding="utf-8", newline="") as file:
+            return self.process_claims_csv_file(file, session)
+
+    def process_claims_csv_file(self, file: TextIO, session: Session) -> List[ClaimRead]:
+        """Process claims from an open CSV text stream"""
+        return self._save_claims(self._iter_csv_claim_rows(file), session)
+
+    def _iter_csv_claim_rows(self, file: TextIO) -> Iterator[Dict[str, Any]]:
+        """Lazily build claim rows from CSV rows so the file is never held in memory"""
+        reader = csv.reader(file)
+
+        header = next(reader, None)
+        if header is None:
+            return
+
+        # Resolve column names to Claim fields once from the header, not per row
+        columns: List[Tuple[int, str]] = []
+        for index, column_name in enumerate(header):
+            field_name = FIELD_MAP.get(column_name.lower().strip())
+            if field_name is not None:
+                columns.append((index, field_name))
+
+        for values in reader:
+            if not values:
                 continue
 
-            # Parse data line
-            data_parts = []
-            current_part = ""
-            in_quotes = False
-
-            for char in line:
-                if char == '"':
-                    in_quotes = not in_quotes
-                elif char == ',' and not in_quotes:
-                    data_parts.append(current_part.strip())
-                    current_part = ""
-                else:
-                    current_part += char
-
-            # Add the last part
-            if current_part:
-                data_parts.append(current_part.strip())
-
-            # Create a dictionary from header and data
-            row = {}
-            for i, header in enumerate(header_parts):
-                if i < len(data_parts):
-                    row[header] = data_parts[i]
-                else:
-                    row[header] = ""
-
-            # Process the claim
+            # Strip padding around values, e.g. "$100.00 "; short rows read as empty
+            row = {
+                field_name: values[index].strip() if index < len(values) else ""
+                for index, field_name in columns
+            }
+
+            # Build the claim; invalid rows are skipped
             try:
-                processed_claim = self.process_claim_data(row, session)
-                processed_claims.append(processed_claim)
+                yield self._build_claim_row(row)
             except Exception as e:
-                print(f"Error processing claim at line {line_idx + 1}: {e}")
+                print(f"Error processing claim at line {reader.line_num}: {e}")
                 continue
 
-        return processed_claims
-
     def get_top_providers_by_net_fee(self, session: Session, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get the top providers by net fee"""
-        # Query to get the sum of net fees grouped by provider_npi
-        from sqlalchemy import func
-        
-        query = (
-            select(
-                Claim.provider_npi,
-                func.sum(Claim.net_fee).label("total_net_fee")
-            )
-            .group_by(Claim.provider_npi)
-            .order_by(func.sum(Claim.net_fee).desc())
-            .limit(limit)
-        )
+        """Get the top providers by net fee, cached for TOP_PROVIDERS_CACHE_TTL seconds"""
+        with self._cache_lock:
+            cached = self._top_providers_cache.get(limit)
+            generation = self._claims_generation
+        if cached is not None and time.monotonic() - cached[0] < TOP_PROVIDERS_CACHE_TTL:
+            return cached[1]
+
+        result = session.exec(TOP_PROVIDERS_QUERY, params={"limit": limit}).all()
 
-        result = session.exec(query).all()
-        
         # Format the result
         top_providers = [
             {
@@ -185,8 +265,22 @@ class ClaimProcessor:
             for provider_npi, total_net_fee in result
         ]
 
+        with self._cache_lock:
+            # Skip caching if claims were saved while the query ran
+            if generation == self._claims_generation:
+                self._top_providers_cache.pop(limit, None)
+                if len(self._top_providers_cache) >= TOP_PROVIDERS_CACHE_SIZE:
+                    del self._top_providers_cache[next(iter(self._top_providers_cache))]
+                self._top_providers_cache[limit] = (time.monotonic(), top_providers)
+
         return top_providers
 
+    def _invalidate_top_providers(self) -> None:
+        """Drop cached leaderboards after claims are committed"""
+        with self._cache_lock:
+            self._claims_generation += 1
+            self._top_providers_cache.clear()
+
 
 # Pseudo code for communication with payments service
 """
@@ -6,7 +6,12 @@ from datetime import datetime
 import json
 import os
 
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.database import get_session
 from app.main import app
+from app.models import Claim, ClaimRead
 from app.services.claim_processor import ClaimProcessor
 
 
@@ -52,23 +57,24 @@ def test_health_endpoint(client):
 
 def test_process_claims_endpoint(client, sample_claim_data):
     """Test process claims endpoint"""
-    # Mock ClaimProcessor.process_claims_json
-    mock_claim = MagicMock()
-    mock_claim.id = 1
-    mock_claim.claim_id = "CLM-12345678"
-    mock_claim.net_fee = Decimal("0.00")
-    mock_claim.service_date = datetime(2018, 3, 28).date()
-    mock_claim.submitted_procedure = "D0180"
-    mock_claim.quadrant = None
-    mock_claim.plan_group = "GRP-1000"
-    mock_claim.subscriber = "3730189502"
-    mock_claim.provider_npi = "1497775530"
-    mock_claim.provider_fees = Decimal("100.00")
-    mock_claim.allowed_fees = Decimal("100.00")
-    mock_claim.member_coinsurance = Decimal("0.00")
-    mock_claim.member_copay = Decimal("0.00")
-
-    with patch.object(ClaimProcessor, "process_claims_json", return_value=[mock_claim]):
+    # Mock ClaimProcessor.process_claims_list
+    mock_claim = ClaimRead(
+        id=1,
+        claim_id="CLM-12345678",
+        net_fee=Decimal("0.00"),
+        service_date=datetime(2018, 3, 28).date(),
+        submitted_procedure="D0180",
+        quadrant=None,
+        plan_group="GRP-1000",
+        subscriber="3730189502",
+        provider_npi="1497775530",
+        provider_fees=Decimal("100.00"),
+        allowed_fees=Decimal("100.00"),
+        member_coinsurance=Decimal("0.00"),
+        member_copay=Decimal("0.00"),
+    )
+
+    with patch.object(ClaimProcessor, "process_claims_list", return_value=[mock_claim]):
         # Create payload with one claim
         payload = {
             "claims": [
@@ -96,29 +102,52 @@ def test_process_claims_endpoint(client, sample_claim_data):
         assert response.json()[0]["claim_id"] == "CLM-12345678"
 
 
+def test_process_claims_endpoint_invalid_payload(client):
+    """Test process claims endpoint rejects malformed payloads"""
+    # Missing required submitted_procedure
+    response = client.post("/claims/process", json={"claims": [{"service_date": "3/28/18 0:00"}]})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "claims", 0, "submitted_procedure"]
+
+    # Body is not valid JSON
+    response = client.post(
+        "/claims/process", content=b"not json", headers={"Content-Type": "application/json"}
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][0] == "body"
+
+
+def test_process_claims_openapi_documents_validation_error():
+    """Test the process claims route documents its 422 response"""
+    schema = app.openapi()
+    responses = schema["paths"]["/claims/process"]["post"]["responses"]
+
+    assert responses["422"]["content"]["application/json"]["schema"] == {
+        "$ref": "#/components/schemas/HTTPValidationError"
+    }
+    assert "HTTPValidationError" in schema["components"]["schemas"]
+
+
 def test_process_claims_csv_endpoint(client, sample_claim_data):
     """Test process claims CSV endpoint"""
-    # Mock ClaimProcessor.process_claims_csv
-    mock_claim = MagicMock()
-    mock_claim.id = 1
-    mock_claim.claim_id = "CLM-12345678"
-    mock_claim.net_fee = Decimal("0.00")
-    mock_claim.service_date = datetime(2018, 3, 28).date()
-    mock_claim.submitted_procedure = "D0180"
-    mock_claim.quadrant = None
-    mock_claim.plan_group = "GRP-1000"
-    mock_claim.subscriber = "3730189502"
-    mock_claim.provider_npi = "1497775530"
-    mock_claim.provider_fees = Decimal("100.00")
-    mock_claim.allowed_fees = Decimal("100.00")
-    mock_claim.member_coinsurance = Decimal("0.00")
-    mock_claim.member_copay = Decimal("0.00")
-
-    # Mock open function to avoid writing to disk
-    mock_open = MagicMock()
-    
-    with patch.object(ClaimProcessor, "process_claims_csv", return_value=[mock_claim]), \
-         patch("builtins.open", mock_open):
+    # Mock ClaimProcessor.process_claims_csv_file
+    mock_claim = ClaimRead(
+        id=1,
+        claim_id="CLM-12345678",
+        net_fee=Decimal("0.00"),
+        service_date=datetime(2018, 3, 28).date(),
+        submitted_procedure="D0180",
+        quadrant=None,
+        plan_group="GRP-1000",
+        subscriber="3730189502",
+        provider_npi="1497775530",
+        provider_fees=Decimal("100.00"),
+        allowed_fees=Decimal("100.00"),
+        member_coinsurance=Decimal("0.00"),
+        member_copay=Decimal("0.00"),
+    )
+
+    with patch.object(ClaimProcessor, "process_claims_csv_file", return_value=[mock_claim]):
         
         # Create a mock CSV file
         csv_content = "service date,submitted procedure,quadrant,Plan/Group #,Subscriber#,Provider NPI,provider fees,Allowed fees,member coinsurance,member copay\n"
@@ -136,6 +165,56 @@ def test_process_claims_csv_endpoint(client, sample_claim_data):
         assert response.json()[0]["claim_id"] == "CLM-12345678"
 
 
+@pytest.fixture
+def sqlite_session():
+    """Fixture overriding get_session with an in-memory SQLite database"""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+
+    def get_test_session():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_test_session
+    with Session(engine) as session:
+        yield session
+    app.dependency_overrides.pop(get_session)
+
+
+def test_process_claims_csv_endpoint_stores_upload(client, sqlite_session):
+    """Test process claims CSV endpoint parses the uploaded file into the database"""
+    with open("claim_1234.csv", "rb") as csv_file:
+        response = client.post(
+            "/claims/process-csv", files={"file": ("claims.csv", csv_file, "text/csv")}
+        )
+
+    # Assertions
+    assert response.status_code == 200
+    claims = response.json()
+    assert len(claims) == 4
+    assert [claim["submitted_procedure"] for claim in claims] == ["D0180", "D0210", "D4346", "D4211"]
+    assert claims[2]["net_fee"] == 81.25  # 130 + 16.25 + 0 - 65
+
+    # Verify the rows were stored
+    stored = sqlite_session.exec(select(Claim)).all()
+    assert sorted(claim.id for claim in stored) == sorted(claim["id"] for claim in claims)
+
+
+def test_process_claims_csv_endpoint_rejects_non_utf8(client, sqlite_session):
+    """Test process claims CSV endpoint rejects uploads that are not UTF-8"""
+    csv_content = "service date,submitted procedure,Provider NPI\n3/28/18 0:00,D0180,caf\u00e9\n"
+
+    response = client.post(
+        "/claims/process-csv",
+        files={"file": ("claims.csv", csv_content.encode("latin-1"), "text/csv")},
+    )
+
+    assert response.status_code == 400
+    assert sqlite_session.exec(select(Claim)).all() == []
+
+
 def test_get_top_providers_endpoint(client):
     """Test get top providers endpoint"""
     # Mock ClaimProcessor.get_top_providers_by_net_fee
@@ -155,3 +234,10 @@ def test_get_top_providers_endpoint(client):
         assert float(response.json()[0]["total_net_fee"]) == float("100.00")
         assert response.json()[1]["provider_npi"] == "0987654321"
         assert float(response.json()[1]["total_net_fee"]) == float("50.00")
+
+
+def test_get_top_providers_endpoint_invalid_limit(client):
+    """Test get top providers endpoint rejects out-of-range limits"""
+    assert client.get("/claims/top-providers?limit=0").status_code == 422
+    assert client.get("/claims/top-providers?limit=-5").status_code == 422
+    assert client.get("/claims/top-providers?limit=101").status_code == 422
@@ -4,7 +4,9 @@ from datetime import datetime
 from unittest.mock import MagicMock, patch
 import json
 
-from app.services.claim_processor import ClaimProcessor
+from app.services.claim_processor import ClaimProcessor, TOP_PROVIDERS_QUERY
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, create_engine, select
 from app.models import Claim
 
 
@@ -14,6 +16,16 @@ def claim_processor():
     return ClaimProcessor()
 
 
+@pytest.fixture
+def mock_session():
+    """Fixture for a session whose INSERT ... RETURNING yields ids 1..n with each claim_id"""
+    session = MagicMock()
+    session.execute.side_effect = lambda statement, rows: [
+        (primary_key, row["claim_id"]) for primary_key, row in enumerate(rows, start=1)
+    ]
+    return session
+
+
 @pytest.fixture
 def sample_claim_data():
     """Fixture for sample claim data"""
@@ -31,11 +43,24 @@ def sample_claim_data():
     }
 
 
-def test_generate_claim_id(claim_processor):
-    """Test generate_claim_id method"""
-    claim_id = claim_processor.generate_claim_id()
-    assert claim_id.startswith("CLM-")
-    assert len(claim_id) == 12  # "CLM-" + 8 hex characters
+def test_generate_claim_ids(claim_processor):
+    """Test generate_claim_ids method"""
+    claim_ids = claim_processor.generate_claim_ids(100)
+    assert len(claim_ids) == 100
+    assert len(set(claim_ids)) == 100
+    assert all(claim_id.startswith("CLM-") and len(claim_id) == 12 for claim_id in claim_ids)
+    assert claim_processor.generate_claim_ids(0) == []
+
+
+def test_generate_claim_ids_replaces_duplicates(claim_processor):
+    """Test generate_claim_ids never repeats an ID within a batch"""
+    with patch(
+        "app.services.claim_processor.os.urandom",
+        side_effect=[b"\x00\x00\x00\x01" * 2, b"\x00\x00\x00\x02"],
+    ):
+        claim_ids = claim_processor.generate_claim_ids(2)
+
+    assert claim_ids == ["CLM-00000001", "CLM-00000002"]
 
 
 def test_calculate_net_fee(claim_processor):
@@ -66,40 +91,40 @@ def test_parse_date(claim_processor):
     assert date == datetime(2018, 3, 28).date()
 
 
-def test_process_claim_data(claim_processor, sample_claim_data):
+def test_normalize_claim_data(claim_processor, sample_claim_data):
+    """Test normalize_claim_data method"""
+    normalized = claim_processor.normalize_claim_data({**sample_claim_data, "unknown": "x"})
+
+    assert normalized["service_date"] == "3/28/18 0:00"
+    assert normalized["plan_group"] == "GRP-1000"
+    assert normalized["provider_npi"] == "1497775530"
+    assert normalized["allowed_fees"] == "$100.00 "
+    assert "unknown" not in normalized
+
+
+def test_process_claim_data(claim_processor, mock_session, sample_claim_data):
     """Test process_claim_data method"""
-    # Mock session
-    mock_session = MagicMock()
+    # Call the method
+    result = claim_processor.process_claim_data(sample_claim_data, mock_session)
     
-    # Mock Claim.from_orm to return a mock claim
-    mock_claim = MagicMock(spec=Claim)
+    # Assertions
+    assert result.id == 1
+    assert result.claim_id.startswith("CLM-")
+    assert result.net_fee == Decimal("0.00")  # 100 + 0 + 0 - 100 = 0
+    assert result.provider_npi == "1497775530"
     
-    with patch("app.services.claim_processor.Claim") as mock_claim_class:
-        mock_claim_class.from_orm.return_value = mock_claim
-        
-        # Call the method
-        result = claim_processor.process_claim_data(sample_claim_data, mock_session)
-        
-        # Assertions
-        assert result == mock_claim
-        assert mock_claim.claim_id.startswith("CLM-")
-        assert mock_claim.net_fee == Decimal("0.00")  # 100 + 0 + 0 - 100 = 0
-        
-        # Verify session methods were called
-        mock_session.add.assert_called_once_with(mock_claim)
-        mock_session.commit.assert_called_once()
-        mock_session.refresh.assert_called_once_with(mock_claim)
+    # Verify the claim was inserted and committed without a refresh
+    mock_session.execute.assert_called_once()
+    mock_session.commit.assert_called_once()
+    mock_session.refresh.assert_not_called()
 
 
-def test_process_claims_json(claim_processor, sample_claim_data):
+def test_process_claims_json(claim_processor, mock_session, sample_claim_data):
     """Test process_claims_json method"""
-    # Mock session
-    mock_session = MagicMock()
-    
-    # Mock process_claim_data to return a mock claim
-    mock_claim = MagicMock(spec=Claim)
-    
-    with patch.object(claim_processor, "process_claim_data", return_value=mock_claim) as mock_process:
+    # Mock _build_claim_row to return a fresh claim row per call
+    with patch.object(
+        claim_processor, "_build_claim_row", side_effect=lambda row: {"net_fee": Decimal("0.00")}
+    ) as mock_build:
         # Create JSON with two claims
         claims_json = json.dumps([sample_claim_data, sample_claim_data])
         
@@ -108,11 +133,98 @@ def test_process_claims_json(claim_processor, sample_claim_data):
         
         # Assertions
         assert len(result) == 2
-        assert result[0] == mock_claim
-        assert result[1] == mock_claim
+        assert [claim.id for claim in result] == [1, 2]
+        assert all(claim.claim_id.startswith("CLM-") for claim in result)
         
-        # Verify process_claim_data was called twice
-        assert mock_process.call_count == 2
+        # Verify _build_claim_row was called twice and the batch was committed once
+        assert mock_build.call_count == 2
+        mock_session.execute.assert_called_once()
+        mock_session.commit.assert_called_once()
+
+
+def test_process_claims_csv(claim_processor, mock_session, tmp_path):
+    """Test process_claims_csv method"""
+    # Create a CSV with two valid claims and one invalid NPI
+    csv_file = tmp_path / "claims.csv"
+    csv_file.write_text(
+        'service date,"submitted procedure",quadrant,"Plan/Group #",Subscriber#,'
+        '"Provider NPI","provider fees","Allowed fees","member coinsurance","member copay"\n'
+        "3/28/18 0:00,D0180,,GRP-1000,3730189502,1497775530,$100.00 ,$100.00 ,$0.00 ,$0.00 \n"
+        "3/28/18 0:00,D4346,,GRP-1000,3730189502,1497775530,$130.00 ,$65.00 ,$16.25 ,$0.00 \n"
+        "3/28/18 0:00,D4211,UR,GRP-1000,3730189502,12345,$178.00 ,$178.00 ,$35.60 ,$0.00 \n"
+    )
+
+    # Call the method
+    result = claim_processor.process_claims_csv(str(csv_file), mock_session)
+
+    # Assertions
+    assert len(result) == 2
+    assert result[0].id == 1
+    assert result[0].net_fee == Decimal("0.00")
+    assert result[1].net_fee == Decimal("81.25")  # 130 + 16.25 + 0 - 65
+    assert result[1].submitted_procedure == "D4346"
+    assert all(claim.claim_id.startswith("CLM-") for claim in result)
+
+    # Verify the batch was inserted in one statement and a single commit
+    mock_session.execute.assert_called_once()
+    assert len(mock_session.execute.call_args.args[1]) == 2
+    mock_session.commit.assert_called_once()
+
+
+def test_process_claims_csv_sqlite(claim_processor, tmp_path):
+    """Test process_claims_csv stores rows and returns their ids against a real SQLite database"""
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+
+    csv_file = tmp_path / "claims.csv"
+    csv_file.write_text(
+        'service date,"submitted procedure",quadrant,"Plan/Group #",Subscriber#,'
+        '"Provider NPI","provider fees","Allowed fees","member coinsurance","member copay"\n'
+        "3/28/18 0:00,D0180,,GRP-1000,3730189502,1497775530,$100.00 ,$100.00 ,$0.00 ,$0.00 \n"
+        "3/28/18 0:00,D4346,,GRP-1000,3730189502,1497775530,$130.00 ,$65.00 ,$16.25 ,$0.00 \n"
+        "3/28/18 0:00,D4211,UR,GRP-1000,3730189502,1234567890,$178.00 ,$178.00 ,$35.60 ,$0.00 \n"
+    )
+
+    # Count INSERT statements sent to SQLite
+    inserts = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_inserts(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT"):
+            inserts.append(statement)
+
+    # Use batches smaller than the file so ids come back across several inserts
+    with Session(engine) as session, patch("app.services.claim_processor.BATCH_SIZE", 2):
+        result = claim_processor.process_claims_csv(str(csv_file), session)
+
+    # One INSERT per batch of 2, not one per row
+    assert len(inserts) == 2
+
+    with Session(engine) as session:
+        stored = {claim.id: claim for claim in session.exec(select(Claim)).all()}
+
+    # Assertions
+    assert [claim.net_fee for claim in result] == [
+        Decimal("0.00"), Decimal("81.25"), Decimal("35.60")
+    ]
+    assert sorted(stored) == sorted(claim.id for claim in result)
+    for claim in result:
+        assert stored[claim.id].claim_id == claim.claim_id
+        assert stored[claim.id].submitted_procedure == claim.submitted_procedure
+        assert stored[claim.id].net_fee == claim.net_fee
+
+
+def test_save_claims_inserts_in_batches(claim_processor, mock_session):
+    """Test _save_claims inserts every BATCH_SIZE rows and commits once"""
+    claim_rows = [{"net_fee": Decimal("0.00")} for _ in range(5)]
+
+    with patch("app.services.claim_processor.BATCH_SIZE", 2):
+        result = claim_processor._save_claims(iter(claim_rows), mock_session)
+
+    # Assertions
+    assert [claim.id for claim in result] == [1, 2, 1, 2, 1]
+    assert mock_session.execute.call_count == 3
+    mock_session.commit.assert_called_once()
 
 
 def test_get_top_providers_by_net_fee(claim_processor):
@@ -135,3 +247,52 @@ def test_get_top_providers_by_net_fee(claim_processor):
     assert result[0]["total_net_fee"] == Decimal("100.00")
     assert result[1]["provider_npi"] == "0987654321"
     assert result[1]["total_net_fee"] == Decimal("50.00")
+
+    # Verify the prebuilt statement was executed with the limit bound
+    mock_session.exec.assert_called_once_with(TOP_PROVIDERS_QUERY, params={"limit": 2})
+
+
+def test_get_top_providers_by_net_fee_is_cached(claim_processor, mock_session):
+    """Test get_top_providers_by_net_fee caches results until claims are saved"""
+    mock_session.exec.return_value.all.return_value = [
+        ("1234567890", Decimal("100.00")),
+    ]
+
+    # Repeated calls are served from the cache
+    first = claim_processor.get_top_providers_by_net_fee(mock_session, 10)
+    second = claim_processor.get_top_providers_by_net_fee(mock_session, 10)
+    assert first == second
+    assert mock_session.exec.call_count == 1
+
+    # A different limit is computed separately
+    claim_processor.get_top_providers_by_net_fee(mock_session, 5)
+    assert mock_session.exec.call_count == 2
+
+    # Saving claims invalidates the cache
+    claim_processor._save_claims([{"net_fee": Decimal("0.00")}], mock_session)
+    claim_processor.get_top_providers_by_net_fee(mock_session, 10)
+    assert mock_session.exec.call_count == 3
+
+
+def test_get_top_providers_by_net_fee_skips_cache_on_concurrent_save(claim_processor, mock_session):
+    """Test a leaderboard computed while claims were saved is not cached"""
+    def exec_during_save(statement, params):
+        # Another request commits claims while this aggregation runs
+        claim_processor._save_claims([{"net_fee": Decimal("0.00")}], mock_session)
+        return MagicMock(all=MagicMock(return_value=[("1234567890", Decimal("100.00"))]))
+
+    mock_session.exec.side_effect = exec_during_save
+    claim_processor.get_top_providers_by_net_fee(mock_session, 10)
+
+    assert 10 not in claim_processor._top_providers_cache
+
+
+def test_get_top_providers_by_net_fee_cache_is_bounded(claim_processor, mock_session):
+    """Test only the most recent TOP_PROVIDERS_CACHE_SIZE limits are cached"""
+    mock_session.exec.return_value.all.return_value = []
+
+    with patch("app.services.claim_processor.TOP_PROVIDERS_CACHE_SIZE", 2):
+        for limit in (1, 2, 3):
+            claim_processor.get_top_providers_by_net_fee(mock_session, limit)
+
+    assert list(claim_processor._top_providers_cache) == [2, 3]